@@ -1,9 +1,83 @@
 import logging
-from typing import List, Dict, Tuple, Any
+import re
+from typing import List, Dict, Tuple, Any, Optional
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+REFUSAL_KEYWORDS = [
+    'cannot help',
+    "don't know",
+    'no information',
+    'not available',
+    'cannot answer',
+    'unable to answer',
+    'no data',
+    'not found',
+    'i cannot',
+    "i can't",
+    'not mentioned',
+    'outside the scope',
+    'beyond my knowledge'
+]
+
+VAGUE_PHRASES = [
+    "it is known that",
+    "everyone knows",
+    "as we all know",
+    "obviously",
+    "clearly",
+    "of course",
+    "needless to say"
+]
+
+
+def _build_automaton(phrases: List[str]):
+    """
+    Compile phrases into an Aho-Corasick automaton (None if unavailable).
+    
+    Args:
+        phrases: Lowercase phrases to match
+        
+    Returns:
+        Automaton whose values are the matched phrases, or None
+    """
+    if ahocorasick is None:
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for phrase in phrases:
+        automaton.add_word(phrase, phrase)
+    automaton.make_automaton()
+    return automaton
+
+
+def _first_match(automaton, pattern: "re.Pattern", text: str) -> Optional[str]:
+    """
+    Return the first phrase found in text, or None.
+    
+    Uses a single automaton pass when available, otherwise falls back to
+    one scan with the precompiled alternation pattern.
+    """
+    if automaton is not None:
+        hit = next(automaton.iter(text), None)
+        return hit[1] if hit else None
+    
+    match = pattern.search(text)
+    return match.group(0) if match else None
+
+
+_VERSION_RE = re.compile(r'v?\d+\.\d+(?:\.\d+)?')
+_REFUSAL_RE = re.compile('|'.join(map(re.escape, REFUSAL_KEYWORDS)))
+_VAGUE_RE = re.compile('|'.join(map(re.escape, VAGUE_PHRASES)))
+_REFUSAL_AC = _build_automaton(REFUSAL_KEYWORDS)
+_VAGUE_AC = _build_automaton(VAGUE_PHRASES)
+
 
 class ResponseEvaluator:
     """Evaluates LLM responses for reliability and trustworthiness."""
@@ -33,44 +107,44 @@ class ResponseEvaluator:
             return True
         return False
     
-    def check_refusal(self, llm_response: str) -> bool:
+    def _lowercase_texts(self,
+                         retrieved_chunks: List[Dict[str, Any]],
+                         llm_response: str) -> Tuple[str, str]:
         """
-        Check if the LLM refused to answer.
+        Lowercase the response and the joined chunk text once per evaluation.
         
         Args:
+            retrieved_chunks: List of retrieved document chunks
             llm_response: Response from LLM
             
         Returns:
-            True if refusal detected (unreliable), False otherwise
+            Tuple of (response_lower, chunk_lower)
         """
-        refusal_keywords = [
-            'cannot help',
-            "don't know",
-            'no information',
-            'not available',
-            'cannot answer',
-            'unable to answer',
-            'no data',
-            'not found',
-            'i cannot',
-            "i can't",
-            'not mentioned',
-            'outside the scope',
-            'beyond my knowledge'
-        ]
+        chunk_text = " ".join(c.get("text", "") for c in retrieved_chunks)
+        return llm_response.lower(), chunk_text.lower()
+    
+    def check_refusal(self, response_lower: str) -> bool:
+        """
+        Check if the LLM refused to answer.
         
-        response_lower = llm_response.lower()
+        Args:
+            response_lower: Lowercased response from LLM
+            
+        Returns:
+            True if refusal detected (unreliable), False otherwise
+        """
+        keyword = _first_match(_REFUSAL_AC, _REFUSAL_RE, response_lower)
         
-        for keyword in refusal_keywords:
-            if keyword in response_lower:
-                logger.warning(f"Refusal detected: '{keyword}' found in response")
-                return True
+        if keyword:
+            logger.warning(f"Refusal detected: '{keyword}' found in response")
+            return True
         
         return False
     
     def check_hallucination(self, 
                            retrieved_chunks: List[Dict[str, Any]], 
-                           llm_response: str) -> bool:
+                           response_lower: str,
+                           chunk_lower: str) -> bool:
         """
         Check if the LLM might be hallucinating (inventing facts).
         
@@ -81,7 +155,8 @@ class ResponseEvaluator:
         
         Args:
             retrieved_chunks: List of retrieved document chunks
-            llm_response: Response from LLM
+            response_lower: Lowercased response from LLM
+            chunk_lower: Lowercased text of all chunks joined by spaces
             
         Returns:
             True if hallucination suspected (unreliable), False otherwise
@@ -89,10 +164,8 @@ class ResponseEvaluator:
         if not retrieved_chunks:
             return False
         
-        # Get total chunk text length
-        chunk_text = " ".join([c.get("text", "") for c in retrieved_chunks])
-        chunk_length = len(chunk_text)
-        response_length = len(llm_response)
+        chunk_length = len(chunk_lower)
+        response_length = len(response_lower)
         
         # Heuristic 1: If response is much longer than all chunks combined,
         # it might be adding information not in the source
@@ -106,35 +179,22 @@ class ResponseEvaluator:
             return True
         
         # Heuristic 2: Check for vague claims without specifics
-        vague_phrases = [
-            "it is known that",
-            "everyone knows",
-            "as we all know",
-            "obviously",
-            "clearly",
-            "of course",
-            "needless to say"
-        ]
-        
-        response_lower = llm_response.lower()
-        for phrase in vague_phrases:
-            if phrase in response_lower:
-                # Vague language combined with confident tone is suspicious
-                logger.warning(f"Suspicious vague language detected: '{phrase}'")
-                return True
+        phrase = _first_match(_VAGUE_AC, _VAGUE_RE, response_lower)
+        if phrase:
+            # Vague language combined with confident tone is suspicious
+            logger.warning(f"Suspicious vague language detected: '{phrase}'")
+            return True
         
         # Heuristic 3: Check if specific product features/versions are mentioned
         # that don't appear in chunks
-        chunk_lower = chunk_text.lower()
+        response_versions = set(_VERSION_RE.findall(response_lower))
+        if not response_versions:
+            return False
         
-        # Look for version numbers or specific features
-        import re
-        version_pattern = r'v?\d+\.\d+(?:\.\d+)?'
-        response_versions = set(re.findall(version_pattern, response_lower))
-        chunk_versions = set(re.findall(version_pattern, chunk_lower))
+        chunk_versions = set(_VERSION_RE.findall(chunk_lower))
         
         # If response mentions versions not in chunks, flag it
-        if response_versions and not response_versions.intersection(chunk_versions):
+        if response_versions.isdisjoint(chunk_versions):
             logger.warning(
                 f"Version mismatch: Response mentions {response_versions} "
                 f"but chunks only mention {chunk_versions}"
@@ -160,10 +220,12 @@ class ResponseEvaluator:
             - is_reliable: True if response passes all checks
             - flags_dict: Dictionary showing which checks failed
         """
+        response_lower, chunk_lower = self._lowercase_texts(retrieved_chunks, llm_response)
+        
         flags = {
             "no_context": self.check_no_context(retrieved_chunks),
-            "refusal": self.check_refusal(llm_response),
-            "hallucination": self.check_hallucination(retrieved_chunks, llm_response)
+            "refusal": self.check_refusal(response_lower),
+            "hallucination": self.check_hallucination(retrieved_chunks, response_lower, chunk_lower)
         }
         
         # Response is reliable if no flags are raised
@@ -191,15 +253,16 @@ class ResponseEvaluator:
             Confidence score between 0.0 and 1.0
         """
         score = 1.0
+        response_lower, chunk_lower = self._lowercase_texts(retrieved_chunks, llm_response)
         
         # Deduct points for various risk factors
         if self.check_no_context(retrieved_chunks):
             score -= 0.5
         
-        if self.check_refusal(llm_response):
+        if self.check_refusal(response_lower):
             score -= 0.3
         
-        if self.check_hallucination(retrieved_chunks, llm_response):
+        if self.check_hallucination(retrieved_chunks, response_lower, chunk_lower):
             score -= 0.4
         
         # Bonus points if we have good context
@@ -6,20 +6,50 @@ PDF Processor - Extracts text from PDFs and creates intelligent chunks.
 import os
 import json
 import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Tuple, Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
 
 try:
     import PyPDF2
 except ImportError:
-    print("Error: PyPDF2 not installed. Run: pip install PyPDF2")
+    PyPDF2 = None
+
+if pdfium is None and PyPDF2 is None:
+    print("Error: no PDF backend installed. Run: pip install pypdfium2 (or PyPDF2)")
     exit(1)
 
+# Pages with less extracted text than this are treated as scanned/blank
+MIN_PAGE_CHARS = 16
+
+_PARA_RE = re.compile(r'\n\s*\n')
+_WS_RE = re.compile(r'\s+')
+
+
+def _write_json(data: Any, output_path: Path) -> None:
+    """Write data as indented UTF-8 JSON, via orjson when available."""
+    if orjson is not None:
+        output_path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
+    
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
 
 class PDFProcessor:
     """Processes PDF files and extracts text with intelligent chunking."""
     
-    def __init__(self, pdf_dir: str = "./docs", output_dir: str = "./extracted_data", max_chunk_words: int = 400):
+    def __init__(self, pdf_dir: str = "./docs", output_dir: str = "./extracted_data", max_chunk_words: int = 400, setup: bool = True):
         """
         Initialize PDF processor.
         
@@ -27,11 +57,16 @@ class PDFProcessor:
             pdf_dir: Directory containing PDF files
             output_dir: Directory to save extracted JSON files
             max_chunk_words: Maximum words per chunk
+            setup: Create the output directory and print the configuration
+                   (worker processes pass False)
         """
         self.pdf_dir = Path(pdf_dir)
         self.output_dir = Path(output_dir)
         self.max_chunk_words = max_chunk_words
         
+        if not setup:
+            return
+        
         # Create output directory
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
@@ -42,58 +77,82 @@ class PDFProcessor:
     
     def extract_text_from_pdf(self, pdf_path: str) -> Dict[int, str]:
         """Extract text from PDF file, organized by page."""
+        try:
+            if pdfium is not None:
+                return self._extract_with_pdfium(pdf_path)
+            return self._extract_with_pypdf2(pdf_path)
+        
+        except Exception as e:
+            print(f"  ✗ Error extracting text: {e}")
+            return {}
+    
+    def _extract_with_pdfium(self, pdf_path: str) -> Dict[int, str]:
+        """Extract page text with PDFium (C++ backend)."""
         page_texts = {}
+        pdf = pdfium.PdfDocument(pdf_path)
         
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
+            for page_num, page in enumerate(pdf, start=1):
+                textpage = page.get_textpage()
+                text = textpage.get_text_range()
+                textpage.close()
+                page.close()
                 
-                for page_num, page in enumerate(pdf_reader.pages, start=1):
-                    text = page.extract_text()
-                    if text.strip():
-                        page_texts[page_num] = text
+                if len(text.strip()) >= MIN_PAGE_CHARS:
+                    page_texts[page_num] = text
+        finally:
+            pdf.close()
+        
+        return page_texts
+    
+    def _extract_with_pypdf2(self, pdf_path: str) -> Dict[int, str]:
+        """Extract page text with PyPDF2 (pure-Python fallback)."""
+        page_texts = {}
+        
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
             
-            return page_texts
+            for page_num, page in enumerate(pdf_reader.pages, start=1):
+                text = page.extract_text()
+                if len(text.strip()) >= MIN_PAGE_CHARS:
+                    page_texts[page_num] = text
         
-        except Exception as e:
-            print(f"  ✗ Error extracting text: {e}")
-            return {}
+        return page_texts
     
-    def split_into_paragraphs(self, text: str) -> List[str]:
-        """Split text into paragraphs based on double newlines."""
-        # Split on double newlines
-        paragraphs = re.split(r'\n\s*\n', text)
-        
-        cleaned = []
-        for para in paragraphs:
-            # Remove extra whitespace
-            cleaned_para = ' '.join(para.split())
-            if cleaned_para.strip():
-                cleaned.append(cleaned_para)
-        
-        return cleaned
+    def split_into_paragraphs(self, text: str) -> List[Tuple[str, int]]:
+        """Split text into (paragraph, word_count) pairs based on double newlines."""
+        # Split on double newlines and collapse whitespace in one pass each.
+        # _WS_RE matches every str.isspace() character, so a normalized
+        # paragraph's words are separated by single ASCII spaces only and
+        # count(' ') + 1 equals len(para.split())
+        paragraphs = (_WS_RE.sub(' ', p).strip() for p in _PARA_RE.split(text))
+        return [(para, para.count(' ') + 1) for para in paragraphs if para]
     
-    def chunk_text(self, paragraphs: List[str]) -> List[str]:
-        """Group paragraphs into chunks with maximum word count."""
+    def chunk_text(self, paragraphs: List[Tuple[int, str, int]]) -> List[Dict[str, Any]]:
+        """Group (page, paragraph, word_count) triples into chunks with maximum word count."""
         chunks = []
         current_chunk = []
+        current_page = None
         current_word_count = 0
         
-        for paragraph in paragraphs:
-            para_word_count = len(paragraph.split())
-            
+        for page_num, paragraph, para_word_count in paragraphs:
             # If adding this paragraph exceeds max, save current chunk
             if current_word_count + para_word_count > self.max_chunk_words and current_chunk:
-                chunks.append(' '.join(current_chunk))
+                chunks.append({"text": ' '.join(current_chunk), "page": current_page,
+                               "word_count": current_word_count})
                 current_chunk = [paragraph]
+                current_page = page_num
                 current_word_count = para_word_count
             else:
+                if not current_chunk:
+                    current_page = page_num
                 current_chunk.append(paragraph)
                 current_word_count += para_word_count
         
         # Don't forget the last chunk
         if current_chunk:
-            chunks.append(' '.join(current_chunk))
+            chunks.append({"text": ' '.join(current_chunk), "page": current_page,
+                           "word_count": current_word_count})
         
         return chunks
     
@@ -108,9 +167,12 @@ class PDFProcessor:
             print(f"    ✗ No text extracted")
             return None
         
-        # Process all text together for chunking
-        all_text = ' '.join(page_texts.values())
-        paragraphs = self.split_into_paragraphs(all_text)
+        # Tag each paragraph with its page so chunks carry their origin
+        paragraphs = [
+            (page_num, paragraph, word_count)
+            for page_num, page_text in page_texts.items()
+            for paragraph, word_count in self.split_into_paragraphs(page_text)
+        ]
         chunks = self.chunk_text(paragraphs)
         
         # Create output structure
@@ -121,29 +183,17 @@ class PDFProcessor:
         }
         
         # Add chunks with metadata
-        for chunk_id, chunk_text in enumerate(chunks, start=1):
-            page_num = self._estimate_page(chunk_text, page_texts)
-            
+        for chunk_id, chunk in enumerate(chunks, start=1):
             output["chunks"].append({
                 "id": chunk_id,
-                "text": chunk_text,
-                "page": page_num,
-                "word_count": len(chunk_text.split())
+                "text": chunk["text"],
+                "page": chunk["page"],
+                "word_count": chunk["word_count"]
             })
         
         print(f"    ✓ Extracted {len(chunks)} chunks from {len(page_texts)} pages")
         return output
     
-    def _estimate_page(self, chunk_text: str, page_texts: Dict[int, str]) -> int:
-        """Estimate which page a chunk came from."""
-        first_words = ' '.join(chunk_text.split()[:20])
-        
-        for page_num, page_text in page_texts.items():
-            if first_words in page_text:
-                return page_num
-        
-        return 1
-    
     def process_all_pdfs(self) -> Dict[str, Any]:
         """Process all PDF files in the input directory."""
         if not self.pdf_dir.exists():
@@ -162,34 +212,56 @@ class PDFProcessor:
         print(f"{'='*60}")
         
         all_documents = {}
+        pdf_files = sorted(pdf_files)
         
-        for pdf_path in sorted(pdf_files):
-            result = self.process_pdf_file(str(pdf_path), pdf_path.name)
-            if result:
-                all_documents[pdf_path.name] = result
+        # Each PDF is independent, so spread them across processes;
+        # map() keeps results in sorted filename order
+        workers = min(len(pdf_files), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                _process_one,
+                [str(p) for p in pdf_files],
+                [p.name for p in pdf_files],
+                [str(self.pdf_dir)] * len(pdf_files),
+                [str(self.output_dir)] * len(pdf_files),
+                [self.max_chunk_words] * len(pdf_files)
+            )
+            for pdf_path, result in zip(pdf_files, results):
+                if result:
+                    all_documents[pdf_path.name] = result
         
         return all_documents
     
     def save_to_json(self, data: Dict[str, Any], output_filename: str = "extracted_documents.json") -> str:
         """Save processed documents to JSON file."""
         output_path = self.output_dir / output_filename
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        _write_json(data, output_path)
         
         print(f"\n✓ Combined data saved to: {output_path}")
         return str(output_path)
     
     def save_individual_files(self, documents: Dict[str, Any]) -> None:
         """Save each document as a separate JSON file."""
-        for filename, doc_data in documents.items():
-            output_filename = Path(filename).stem + "_extracted.json"
-            output_path = self.output_dir / output_filename
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(doc_data, f, indent=2, ensure_ascii=False)
+        # Writes are independent and mostly I/O, so threads are enough
+        workers = min(32, (os.cpu_count() or 4) * 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for filename, doc_data in documents.items():
+                output_filename = Path(filename).stem + "_extracted.json"
+                output_path = self.output_dir / output_filename
+                futures.append((output_filename, executor.submit(_write_json, doc_data, output_path)))
             
-            print(f"✓ Saved: {output_filename}")
+            for output_filename, future in futures:
+                future.result()
+                print(f"✓ Saved: {output_filename}")
+
+
+def _process_one(pdf_path: str, filename: str, pdf_dir: str, output_dir: str,
+                 max_chunk_words: int) -> Dict[str, Any]:
+    """Process one PDF in a worker process (module-level so it pickles)."""
+    # The parent already created the output dir and printed the config
+    processor = PDFProcessor(pdf_dir, output_dir, max_chunk_words, setup=False)
+    return processor.process_pdf_file(pdf_path, filename)
 
 
 def main():
@@ -1,11 +1,119 @@
 import json
 import logging
+import mmap
+import os
+import pickle
+import tempfile
+import threading
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, FrozenSet
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from datasketch import MinHash, MinHashLSHEnsemble
+except ImportError:
+    MinHash = MinHashLSHEnsemble = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# MinHash LSH shortlisting only pays off once a linear scan gets expensive.
+# It tests containment |query & chunk| / |query| of the query's known words,
+# not Jaccard: a few-word query can never reach a useful Jaccard score against
+# a chunk of ~100 distinct words, which leaves only tiny heading chunks
+LSH_MIN_CHUNKS = 5_000
+LSH_NUM_PERM = 64
+LSH_NUM_PART = 16
+LSH_CONTAINMENT = 0.5
+
+# Below this size one read() beats setting up a mapping
+MMAP_MIN_BYTES = 64 * 1024
+
+# Okapi BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Built index is pickled next to the extracted JSON and reused while the
+# source files are unchanged; bump the version when the layout changes
+INDEX_CACHE_FILE = ".index.pkl"
+INDEX_CACHE_VERSION = 3
+INDEX_ATTRS = (
+    "documents", "vocab", "texts", "pages", "sources", "chunk_ids",
+    "word_counts", "postings_flat", "postings_offs", "postings_weights",
+    "lsh",
+)
+
+
+def _read_json(path: Path) -> Any:
+    """
+    Parse a JSON file straight from bytes when orjson is available.
+    
+    Files of at least MMAP_MIN_BYTES are parsed from a read-only mmap so the
+    contents are never copied into a Python bytes object.
+    
+    Args:
+        path: JSON file to read
+        
+    Returns:
+        Parsed JSON value
+    """
+    if orjson is None:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    with open(path, 'rb') as f:
+        size = f.seek(0, 2)
+        if size < MMAP_MIN_BYTES:
+            f.seek(0)
+            return orjson.loads(f.read())
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                return orjson.loads(view)
+
+
+def _accumulate_postings(query_ids: np.ndarray,
+                         postings_flat: np.ndarray,
+                         postings_offs: np.ndarray,
+                         postings_weights: np.ndarray,
+                         out: np.ndarray) -> None:
+    """
+    Add each query word's posting weights to the scores of its chunks.
+    
+    Args:
+        query_ids: Word ids of the query
+        postings_flat: Chunk ids of all postings lists, concatenated
+        postings_offs: Start offset of each word's postings (length vocab + 1)
+        postings_weights: BM25 weight of each posting, aligned with postings_flat
+        out: Per-chunk scores, updated in place
+    """
+    for word_id in query_ids:
+        start, end = postings_offs[word_id], postings_offs[word_id + 1]
+        out[postings_flat[start:end]] += postings_weights[start:end]
+
+
+def _accumulate_postings_loop(query_ids, postings_flat, postings_offs, postings_weights, out):
+    # Same as _accumulate_postings as a scalar loop for numba to compile (kept
+    # serial: parallel words would race on shared chunk scores)
+    for i in range(query_ids.shape[0]):
+        word_id = query_ids[i]
+        for j in range(postings_offs[word_id], postings_offs[word_id + 1]):
+            out[postings_flat[j]] += postings_weights[j]
+
+
+if njit is not None:
+    _accumulate_postings = njit(cache=True)(_accumulate_postings_loop)
 
 class DocumentRetriever:
     """Retrieves relevant document chunks based on query similarity."""
@@ -28,50 +136,226 @@ class DocumentRetriever:
             return
         
         json_files = list(self.data_dir.glob("*.json"))
+        cache_key = self._index_cache_key(json_files)
+        
+        if self._load_index_cache(cache_key):
+            logger.info(f"Loaded {len(self.documents)} documents from index cache")
+            return
         
         for json_file in json_files:
             try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # Handle both single document and collection format
-                    if isinstance(data, dict):
-                        if "file" in data and "chunks" in data:
-                            # Single document format
-                            self.documents.append(data)
-                        elif isinstance(next(iter(data.values()), None), dict):
-                            # Collection format
-                            for filename, doc_data in data.items():
-                                self.documents.append(doc_data)
-                    elif isinstance(data, list):
-                        self.documents.extend(data)
+                data = _read_json(json_file)
+                
+                # Handle both single document and collection format
+                if isinstance(data, dict):
+                    if "file" in data and "chunks" in data:
+                        # Single document format
+                        self.documents.append(data)
+                    elif isinstance(next(iter(data.values()), None), dict):
+                        # Collection format
+                        for filename, doc_data in data.items():
+                            self.documents.append(doc_data)
+                elif isinstance(data, list):
+                    self.documents.extend(data)
             
             except Exception as e:
                 logger.error(f"Error loading {json_file}: {e}")
         
+        self.build_index()
+        self._save_index_cache(cache_key)
+        
         logger.info(f"Loaded {len(self.documents)} documents")
     
-    def similarity_score(self, query: str, text: str) -> float:
+    def _index_cache_key(self, json_files: List[Path]) -> tuple:
         """
-        Calculate similarity between query and text using word overlap.
+        Identify the current source files and index layout.
         
         Args:
-            query: User query
-            text: Document text
+            json_files: Extracted JSON files the index is built from
             
         Returns:
-            Similarity score between 0 and 1
+            Tuple of cache version, LSH availability and a sorted manifest of
+            (name, mtime_ns, size) per file
         """
-        query_words = set(query.lower().split())
-        text_words = set(text.lower().split())
+        manifest = []
+        for json_file in json_files:
+            stat = json_file.stat()
+            manifest.append((json_file.name, stat.st_mtime_ns, stat.st_size))
         
-        if not query_words:
-            return 0.0
+        return (INDEX_CACHE_VERSION, MinHashLSHEnsemble is not None, tuple(sorted(manifest)))
+    
+    def _load_index_cache(self, cache_key: tuple) -> bool:
+        """
+        Restore a previously built index if its source files are unchanged.
         
-        # Jaccard similarity
-        intersection = len(query_words.intersection(text_words))
-        union = len(query_words.union(text_words))
+        Args:
+            cache_key: Key computed by _index_cache_key for the current files
+            
+        Returns:
+            True if the cached index was loaded, False if it must be rebuilt
+        """
+        cache_file = self.data_dir / INDEX_CACHE_FILE
+        if not cache_file.exists():
+            return False
+        
+        try:
+            with open(cache_file, 'rb') as f:
+                cached_key, state = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable index cache {cache_file}: {e}")
+            return False
+        
+        if cached_key != cache_key:
+            return False
         
-        return intersection / union if union > 0 else 0.0
+        for attr in INDEX_ATTRS:
+            setattr(self, attr, state[attr])
+        return True
+    
+    def _save_index_cache(self, cache_key: tuple) -> None:
+        """
+        Pickle the built index next to the source files.
+        
+        The pickle is written to a temporary file and renamed into place, so
+        concurrent starts or a crash mid-dump never leave a truncated cache.
+        
+        Args:
+            cache_key: Key computed by _index_cache_key for the current files
+        """
+        cache_file = self.data_dir / INDEX_CACHE_FILE
+        state = {attr: getattr(self, attr) for attr in INDEX_ATTRS}
+        
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile('wb', dir=self.data_dir, prefix=INDEX_CACHE_FILE + '.',
+                                             suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                pickle.dump((cache_key, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_file)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+            # TypeError/AttributeError are how unpicklable objects usually fail
+            logger.warning(f"Could not write index cache {cache_file}: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    
+    @staticmethod
+    def tokenize(text: str) -> FrozenSet[str]:
+        """
+        Split text into a set of lowercase words.
+        
+        Args:
+            text: Text to tokenize
+            
+        Returns:
+            Frozen set of lowercase words
+        """
+        return frozenset(text.lower().split())
+    
+    def build_index(self) -> None:
+        """
+        Build the inverted index used for scoring.
+        
+        Every distinct word gets a small integer id; the vocab holds the only
+        copy of each word string and chunks are tokenized straight into uint32
+        id arrays. The sorted chunk ids containing each word are laid out
+        CSR-style (postings_flat sliced by postings_offs) alongside each
+        posting's precomputed BM25 weight, so a query only touches the
+        postings of its own words. Chunk metadata is
+        kept as parallel columns (texts, pages, sources, chunk_ids,
+        word_counts) indexed by chunk position. Large corpora additionally
+        get a MinHash LSH Ensemble index that shortlists chunks containing
+        enough of the query's words before scoring.
+        """
+        self.vocab: Dict[str, int] = {}
+        self.texts: List[str] = []
+        pages, sources, chunk_ids, word_counts = [], [], [], []
+        vocab = self.vocab
+        chunk_word_ids = []
+        use_lsh = MinHashLSHEnsemble is not None and sum(
+            len(doc.get("chunks", [])) for doc in self.documents
+        ) >= LSH_MIN_CHUNKS
+        self.lsh = MinHashLSHEnsemble(
+            threshold=LSH_CONTAINMENT, num_perm=LSH_NUM_PERM, num_part=LSH_NUM_PART
+        ) if use_lsh else None
+        signatures = []
+        
+        for doc in self.documents:
+            filename = doc.get("file", "unknown")
+            
+            for chunk in doc.get("chunks", []):
+                # Fill missing fields once on the stored chunk (a get() default
+                # would re-split the text even when word_count is present)
+                chunk_text = chunk.setdefault("text", "")
+                if "word_count" not in chunk:
+                    chunk["word_count"] = len(chunk_text.split())
+                chunk.setdefault("page", 1)
+                chunk.setdefault("id", 0)
+                
+                words = chunk_text.lower().split()
+                chunk_word_ids.append(np.fromiter(
+                    (vocab.setdefault(word, len(vocab)) for word in words),
+                    dtype=np.uint32, count=len(words)
+                ))
+                if use_lsh:
+                    word_set = frozenset(words)
+                    signatures.append((len(self.texts), self._minhash(word_set), len(word_set)))
+                
+                self.texts.append(chunk_text)
+                pages.append(chunk["page"])
+                sources.append(filename)
+                chunk_ids.append(chunk["id"])
+                word_counts.append(chunk["word_count"])
+        
+        self.pages = np.asarray(pages, dtype=np.int32)
+        self.sources = np.asarray(sources, dtype=object)
+        self.chunk_ids = np.asarray(chunk_ids, dtype=np.int32)
+        self.word_counts = np.asarray(word_counts, dtype=np.int32)
+        
+        # One sort over (word, chunk) keys of every token gives the postings
+        # word-major with ascending chunk ids, and the term frequencies as
+        # duplicate counts. Word ids are dense, so word w's chunks are
+        # postings_flat[postings_offs[w]:postings_offs[w + 1]]
+        n_chunks = len(self.texts)
+        stride = max(n_chunks, 1)
+        chunk_lengths = np.fromiter((len(ids) for ids in chunk_word_ids),
+                                    dtype=np.int64, count=n_chunks)
+        all_word_ids = (np.concatenate(chunk_word_ids) if chunk_word_ids
+                        else np.zeros(0, dtype=np.uint32))
+        token_chunks = np.repeat(np.arange(n_chunks, dtype=np.int64), chunk_lengths)
+        keys, tf = np.unique(all_word_ids.astype(np.int64) * stride + token_chunks,
+                             return_counts=True)
+        
+        lengths = np.bincount(keys // stride, minlength=len(vocab))
+        self.postings_offs = np.concatenate(([0], np.cumsum(lengths)))
+        self.postings_flat = (keys % stride).astype(np.int32)
+        tf = tf.astype(np.float32)
+        
+        # BM25 weight of each (word, chunk) posting:
+        # idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len))
+        chunk_lengths = chunk_lengths.astype(np.float32)
+        avg_length = chunk_lengths.mean() if n_chunks else 1.0
+        idf = np.log((n_chunks - lengths + 0.5) / (lengths + 0.5) + 1).astype(np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk_lengths[self.postings_flat] / max(avg_length, 1.0))
+        self.postings_weights = np.repeat(idf, lengths) * tf * (BM25_K1 + 1) / (tf + norm)
+        
+        if use_lsh:
+            # The ensemble partitions by set size, so it is indexed in one go
+            self.lsh.index(signatures)
+    
+    @staticmethod
+    def _minhash(words: FrozenSet[str]) -> "MinHash":
+        """
+        Compute the MinHash signature of a word set.
+        
+        Args:
+            words: Lowercase words
+            
+        Returns:
+            MinHash with LSH_NUM_PERM permutations
+        """
+        signature = MinHash(num_perm=LSH_NUM_PERM)
+        signature.update_batch([word.encode('utf-8') for word in words])
+        return signature
     
     def retrieve_chunks(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """
@@ -88,40 +372,82 @@ class DocumentRetriever:
             logger.warning("No documents loaded - returning empty results")
             return []
         
-        scored_chunks = []
+        q_tokens = self.tokenize(query)
+        q_ids = [self.vocab[word] for word in q_tokens if word in self.vocab]
         
-        # Score all chunks
-        for doc in self.documents:
-            filename = doc.get("file", "unknown")
-            chunks = doc.get("chunks", [])
-            
-            for chunk in chunks:
-                chunk_text = chunk.get("text", "")
-                score = self.similarity_score(query, chunk_text)
-                
-                if score > 0:  # Only include chunks with some relevance
-                    scored_chunks.append({
-                        "text": chunk_text,
-                        "page": chunk.get("page", 1),
-                        "source": filename,
-                        "chunk_id": chunk.get("id", 0),
-                        "score": score,
-                        "word_count": chunk.get("word_count", len(chunk_text.split()))
-                    })
-        
-        # Sort by score and return top-k
-        scored_chunks.sort(key=lambda x: x["score"], reverse=True)
-        top_chunks = scored_chunks[:top_k]
+        if not q_ids:
+            logger.info("Retrieved 0 chunks for query")
+            return []
+        
+        q_ids = np.asarray(q_ids, dtype=np.int64)
+        
+        # LSH shortlist on large corpora: chunks containing at least
+        # LSH_CONTAINMENT of the query's known words. Fall back to the full
+        # postings scan when it finds nothing so recall never drops to zero
+        shortlist = []
+        if self.lsh is not None:
+            known_words = frozenset(word for word in q_tokens if word in self.vocab)
+            shortlist = list(self.lsh.query(self._minhash(known_words), len(known_words)))
+        
+        if shortlist:
+            # BM25 over the shortlisted chunks only: binary-search each query
+            # word's sorted postings for the candidates
+            candidates = np.asarray(sorted(shortlist), dtype=np.int64)
+            scores = np.zeros(len(candidates))
+            for word_id in q_ids:
+                start, end = self.postings_offs[word_id], self.postings_offs[word_id + 1]
+                chunk_list = self.postings_flat[start:end]
+                pos = np.minimum(np.searchsorted(chunk_list, candidates), len(chunk_list) - 1)
+                hit = chunk_list[pos] == candidates
+                scores[hit] += self.postings_weights[start + pos[hit]]
+        else:
+            # BM25 for every chunk at once from the query words' postings
+            scores = np.zeros(len(self.texts))
+            _accumulate_postings(q_ids, self.postings_flat, self.postings_offs,
+                                 self.postings_weights, scores)
+            candidates = np.arange(len(self.texts))
+        
+        # Only chunks sharing at least one query word (BM25 weights are > 0)
+        relevant = scores > 0
+        candidates, scores = candidates[relevant], scores[relevant]
+        
+        # Partial selection keeping every chunk tied with the k-th score,
+        # then order the survivors by score with chunk order breaking ties
+        if len(candidates) > top_k:
+            kth_score = -np.partition(-scores, top_k - 1)[top_k - 1]
+            keep = scores >= kth_score
+            candidates, scores = candidates[keep], scores[keep]
+        order = np.lexsort((candidates, -scores))[:top_k]
+        top_idx, top_scores = candidates[order], scores[order]
+        
+        # Materialize result dicts for the top-k only
+        top_chunks = [
+            {
+                "text": self.texts[i],
+                "page": int(self.pages[i]),
+                "source": self.sources[i],
+                "chunk_id": int(self.chunk_ids[i]),
+                "word_count": int(self.word_counts[i]),
+                "score": float(score)
+            }
+            for i, score in zip(top_idx, top_scores)
+        ]
         
         logger.info(f"Retrieved {len(top_chunks)} chunks for query")
         
         return top_chunks
 
 
+_RETRIEVER = None
+_RETRIEVER_LOCK = threading.Lock()
+
+
 def retrieve_chunks(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
     """
     Convenience function to retrieve chunks.
     
+    The shared DocumentRetriever is built on first use and reused afterwards.
+    
     Args:
         query: User's question
         top_k: Number of chunks to retrieve
@@ -129,5 +455,9 @@ def retrieve_chunks(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
     Returns:
         List of relevant chunks
     """
-    retriever = DocumentRetriever()
-    return retriever.retrieve_chunks(query, top_k=top_k)
\ No newline at end of file
+    global _RETRIEVER
+    if _RETRIEVER is None:
+        with _RETRIEVER_LOCK:
+            if _RETRIEVER is None:
+                _RETRIEVER = DocumentRetriever()
+    return _RETRIEVER.retrieve_chunks(query, top_k=top_k)
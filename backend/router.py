@@ -1,13 +1,105 @@
+import atexit
 import json
 import logging
+import mmap
+import re
+import struct
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Tuple
 
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+LOG_BUFFER_SIZE = 1 << 16
+LOG_FLUSH_EVERY = 32
+
+# Fixed-size summary record mirrored into the .bin sidecar for every log line:
+# classification (0 simple, 1 complex), latency_ms (0 if unknown), reliable
+_LOG_RECORD = struct.Struct('<BiB')
+_LOG_DT = np.dtype([('cls', 'u1'), ('latency_ms', '<i4'), ('reliable', 'u1')])
+
+# Reasoning keywords must start a word but may be inflected (troubleshooting,
+# compared, configuring); complaint phrases match anywhere
+_REASONING_RE = re.compile(r'\b(?:how|why|compar|explain|troubleshoot|design|architect|setup|configur)\w*')
+_COMPLAINT_RE = re.compile(r'not working|error|problem|issue|help|fail|bug')
+_REASONING_ID, _COMPLAINT_ID = 0, 1
+
+
+def _compile_keyword_db():
+    """
+    Compile both keyword patterns into one Hyperscan database (None if unavailable).
+    
+    Returns:
+        Block-mode database whose match ids are _REASONING_ID/_COMPLAINT_ID, or None
+    """
+    if hyperscan is None:
+        return None
+    
+    # UTF8 + UCP keep \b's notion of word characters the same as Python's
+    flags = hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+    db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    db.compile(
+        expressions=[_REASONING_RE.pattern.encode(), _COMPLAINT_RE.pattern.encode()],
+        ids=[_REASONING_ID, _COMPLAINT_ID],
+        flags=[flags, flags]
+    )
+    return db
+
+
+_KEYWORD_DB = _compile_keyword_db()
+_HS_LOCAL = threading.local()
+
+
+def _keyword_hits(query_lower: str) -> set:
+    """
+    Return which keyword groups occur in a lowercased query.
+    
+    Scans once with the Hyperscan database when available, otherwise with
+    the two precompiled regexes.
+    
+    Args:
+        query_lower: Lowercased user query
+        
+    Returns:
+        Set containing _REASONING_ID and/or _COMPLAINT_ID
+    """
+    if _KEYWORD_DB is None:
+        hits = set()
+        if _REASONING_RE.search(query_lower):
+            hits.add(_REASONING_ID)
+        if _COMPLAINT_RE.search(query_lower):
+            hits.add(_COMPLAINT_ID)
+        return hits
+    
+    # Scratch space is per thread; the compiled database is shared
+    scratch = getattr(_HS_LOCAL, "scratch", None)
+    if scratch is None:
+        scratch = _HS_LOCAL.scratch = hyperscan.Scratch(_KEYWORD_DB)
+    
+    hits = set()
+    _KEYWORD_DB.scan(
+        query_lower.encode('utf-8'),
+        match_event_handler=lambda match_id, start, end, flags, ctx: ctx.add(match_id),
+        context=hits,
+        scratch=scratch
+    )
+    return hits
+
 
 class QueryRouter:
     """Routes queries to appropriate LLM model based on complexity."""
@@ -21,6 +113,41 @@ class QueryRouter:
         """
         self.logs_file = Path(logs_file)
         self.logs_file.parent.mkdir(parents=True, exist_ok=True)
+        
+        self.stats_file = self.logs_file.with_suffix('.bin')
+        
+        # Long-lived append handles for the JSONL log and its binary summary
+        # sidecar, opened on first write
+        self._log_fh = None
+        self._stats_fh = None
+        self._log_lock = threading.Lock()
+        self._pending_writes = 0
+    
+    def _open_log(self):
+        """Open the buffered binary append handles and close them at exit."""
+        # Seed the sidecar from any JSONL entries written before it existed
+        if not self.stats_file.exists() and self.logs_file.exists():
+            self.stats_file.write_bytes(self._records_from_jsonl())
+        
+        self._log_fh = open(self.logs_file, 'ab', buffering=LOG_BUFFER_SIZE)
+        self._stats_fh = open(self.stats_file, 'ab', buffering=LOG_BUFFER_SIZE)
+        atexit.register(self.close)
+    
+    def flush(self) -> None:
+        """Flush buffered log lines to disk."""
+        with self._log_lock:
+            if self._log_fh is not None:
+                self._log_fh.flush()
+                self._stats_fh.flush()
+                self._pending_writes = 0
+    
+    def close(self) -> None:
+        """Flush and close the log handles."""
+        with self._log_lock:
+            if self._log_fh is not None:
+                self._log_fh.close()
+                self._stats_fh.close()
+                self._log_fh = self._stats_fh = None
     
     def classify_query(self, query: str) -> str:
         """
@@ -32,28 +159,16 @@ class QueryRouter:
         Returns:
             'simple' or 'complex' classification
         """
-        score = 0
-        query_lower = query.lower()
-        
-        # Count questions - multiple questions indicate complexity
-        question_count = query.count('?')
-        if question_count > 1:
-            score += 2
-        
-        # Check query length - longer queries tend to be more complex
-        word_count = len(query.split())
-        if word_count > 25:
-            score += 1
-        
-        # Check for reasoning keywords
-        reasoning_words = ['how', 'why', 'compare', 'explain', 'troubleshoot', 'design', 'architecture', 'setup', 'configure']
-        if any(word in query_lower for word in reasoning_words):
-            score += 1
+        hits = _keyword_hits(query.lower())
         
-        # Check for problem/error keywords
-        complaint_words = ['not working', 'error', 'problem', 'issue', 'help', 'fail', 'bug']
-        if any(word in query_lower for word in complaint_words):
-            score += 1
+        # Multiple questions (+2), long queries over 25 words (+1), reasoning
+        # keywords (+1) and problem/error keywords (+1)
+        score = (
+            (query.count('?') > 1) * 2
+            + (len(query.split()) > 25)
+            + (_REASONING_ID in hits)
+            + (_COMPLAINT_ID in hits)
+        )
         
         # Decision threshold: score >= 2 = complex, else simple
         classification = "complex" if score >= 2 else "simple"
@@ -113,54 +228,101 @@ class QueryRouter:
         if response_reliable is not None:
             log_entry["response_reliable"] = response_reliable
         
-        # Append to JSONL file
+        # Append to JSONL file and the summary sidecar, flushing every
+        # LOG_FLUSH_EVERY entries
+        if orjson is not None:
+            line = orjson.dumps(log_entry, option=orjson.OPT_APPEND_NEWLINE)
+        else:
+            line = (json.dumps(log_entry) + '\n').encode('utf-8')
         try:
-            with open(self.logs_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry) + '\n')
+            with self._log_lock:
+                if self._log_fh is None:
+                    self._open_log()
+                self._log_fh.write(line)
+                self._stats_fh.write(self._stats_record(log_entry))
+                self._pending_writes += 1
+                if self._pending_writes >= LOG_FLUSH_EVERY:
+                    self._log_fh.flush()
+                    self._stats_fh.flush()
+                    self._pending_writes = 0
             logger.info(f"Logged query classification: {classification} -> {model_used}")
         except Exception as e:
             logger.error(f"Failed to log query classification: {e}")
     
+    @staticmethod
+    def _stats_record(entry: dict) -> bytes:
+        """
+        Pack the fields used by get_logs_summary into a fixed-size record.
+        
+        Args:
+            entry: Log entry as written to the JSONL file
+            
+        Returns:
+            Packed _LOG_RECORD bytes
+        """
+        return _LOG_RECORD.pack(
+            entry.get("classification") != "simple",
+            int(entry.get("latency_ms") or 0),
+            entry.get("response_reliable") is True
+        )
+    
+    @staticmethod
+    def _iter_log_lines(f):
+        """Yield raw lines from a log file through a read-only mmap."""
+        # mmap rejects empty files
+        if f.seek(0, 2) == 0:
+            return
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from iter(mm.readline, b"")
+    
+    def _records_from_jsonl(self) -> bytes:
+        """
+        Rebuild sidecar records by parsing the JSONL log.
+        
+        Returns:
+            Concatenated _LOG_RECORD bytes, one per valid log line
+        """
+        records = []
+        
+        with open(self.logs_file, 'rb') as f:
+            for line in self._iter_log_lines(f):
+                try:
+                    entry = orjson.loads(line) if orjson is not None else json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records.append(self._stats_record(entry))
+        
+        return b"".join(records)
+    
     def get_logs_summary(self) -> dict:
         """
         Generate summary statistics from logs.
         
+        Reads the fixed-size sidecar records; the JSONL log is only parsed
+        when no sidecar exists yet.
+        
         Returns:
             Dictionary with summary statistics
         """
+        self.flush()
+        
         if not self.logs_file.exists():
             return {"total_queries": 0, "summary": "No logs found"}
         
-        simple_count = 0
-        complex_count = 0
-        total_latency = 0
-        latency_count = 0
-        reliable_count = 0
-        total_count = 0
-        
         try:
-            with open(self.logs_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        entry = json.loads(line)
-                        total_count += 1
-                        
-                        if entry.get("classification") == "simple":
-                            simple_count += 1
-                        else:
-                            complex_count += 1
-                        
-                        if entry.get("latency_ms"):
-                            total_latency += entry["latency_ms"]
-                            latency_count += 1
-                        
-                        if entry.get("response_reliable") is True:
-                            reliable_count += 1
-                    
-                    except json.JSONDecodeError:
-                        continue
+            if self.stats_file.exists():
+                # Ignore a trailing partial record from an interrupted write
+                count = self.stats_file.stat().st_size // _LOG_DT.itemsize
+                records = np.fromfile(self.stats_file, dtype=_LOG_DT, count=count)
+            else:
+                records = np.frombuffer(self._records_from_jsonl(), dtype=_LOG_DT)
             
-            avg_latency = total_latency / latency_count if latency_count > 0 else 0
+            total_count = len(records)
+            simple_count, complex_count = (int(n) for n in np.bincount(records['cls'], minlength=2)[:2])
+            latencies = records['latency_ms'][records['latency_ms'] != 0]
+            avg_latency = float(latencies.mean()) if len(latencies) > 0 else 0
+            reliable_count = int(records['reliable'].sum())
             
             return {
                 "total_queries": total_count,
@@ -177,7 +339,6 @@ class QueryRouter:
             logger.error(f"Error reading logs: {e}")
             return {"error": str(e)}
 
-
 def route_query(query: str) -> Tuple[str, str]:
     """
     Convenience function to classify a query and get the appropriate model.